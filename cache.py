@@ -0,0 +1,114 @@
+"""
+Cache Helper Functions
+
+Two-level cache for hot, rarely-changing read paths:
+an in-process dict (L1) in front of a shared Redis instance (L2).
+Values are stored as ready-to-send JSON bytes. Redis is optional; without
+REDIS_URL only the in-process layer is used, and Redis errors fall back to
+the database instead of failing the request.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+load_dotenv()
+
+_redis = None
+
+redis_url = os.getenv("REDIS_URL")
+
+# L1 entries live shorter than Redis entries so that an invalidation done by
+# another worker becomes visible here within L1_TTL_SECONDS.
+DEFAULT_TTL_SECONDS = 300
+L1_TTL_SECONDS = 30
+L1_MAX_ENTRIES = 1024
+
+# Fail fast to the database when Redis is slow or unreachable
+REDIS_TIMEOUT_SECONDS = 0.1
+
+_local: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+
+async def connect_cache():
+    """Create the Redis client on the running event loop (no-op without REDIS_URL)"""
+    global _redis
+    if redis_url and _redis is None:
+        _redis = redis.from_url(
+            redis_url,
+            socket_connect_timeout=REDIS_TIMEOUT_SECONDS,
+            socket_timeout=REDIS_TIMEOUT_SECONDS,
+        )
+    return _redis
+
+async def close_cache():
+    """Close the Redis client (call on application shutdown)"""
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+    _redis = None
+
+async def cache_get(key: str) -> Optional[bytes]:
+    """Return cached bytes for key, checking the in-process layer first"""
+    entry = _local.get(key)
+    if entry is not None:
+        expires_at, value = entry
+        if expires_at > time.monotonic():
+            return value
+        _local.pop(key, None)
+
+    if _redis is None:
+        return None
+    try:
+        value = await _redis.get(key)
+    except RedisError:
+        return None
+    if value is not None:
+        _local_set(key, value)
+    return value
+
+async def cache_set(key: str, value: bytes, ttl: int = DEFAULT_TTL_SECONDS):
+    """Store bytes under key in both layers"""
+    _local_set(key, value, min(ttl, L1_TTL_SECONDS))
+    if _redis is None:
+        return
+    try:
+        await _redis.set(key, value, ex=ttl)
+    except RedisError:
+        pass
+
+async def cache_delete(*keys: str, prefix: Optional[str] = None):
+    """Drop keys (and optionally every key starting with prefix) from both layers"""
+    for key in keys:
+        _local.pop(key, None)
+    if prefix:
+        for key in [k for k in _local if k.startswith(prefix)]:
+            _local.pop(key, None)
+
+    if _redis is None:
+        return
+    try:
+        if keys:
+            await _redis.delete(*keys)
+        if prefix:
+            async for key in _redis.scan_iter(match=prefix + "*"):
+                await _redis.delete(key)
+    except RedisError:
+        pass
+
+def _local_set(key: str, value: bytes, ttl: int = L1_TTL_SECONDS):
+    # Kept in write order (rewrites move to the end), so the front holds the
+    # oldest entries and eviction never has to scan the whole dict.
+    now = time.monotonic()
+    _local.pop(key, None)
+    while _local:
+        oldest = next(iter(_local))
+        if _local[oldest][0] > now and len(_local) < L1_MAX_ENTRIES:
+            break
+        _local.popitem(last=False)
+    _local[key] = (now + ttl, value)
@@ -5,11 +5,11 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Union
 from pydantic import BaseModel
 
 # Load environment variables from .env file
@@ -21,12 +21,49 @@ db = None
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
-if database_url and database_name:
-    _client = MongoClient(database_url)
-    db = _client[database_name]
+# Per-process pool settings; keep max_pool_size * workers within the server's connection limit
+pool_options = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 50)),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 10)),
+    "maxIdleTimeMS": 60000,
+    "waitQueueTimeoutMS": 2500,
+    "serverSelectionTimeoutMS": 3000,
+    "retryWrites": True,
+}
+
+
+async def connect_db():
+    """Create the async client on the running event loop and return the database"""
+    global _client, db
+    if database_url and database_name and _client is None:
+        _client = AsyncMongoClient(database_url, **pool_options)
+        db = _client[database_name]
+        # Open the first pooled connection before serving traffic
+        await _client.admin.command("ping")
+    return db
+
+async def close_db():
+    """Close the async client (call on application shutdown)"""
+    global _client, db
+    if _client is not None:
+        await _client.close()
+    _client = None
+    db = None
+
+def supports_transactions() -> bool:
+    """Multi-document transactions need a replica set, sharded cluster or load-balanced deployment"""
+    if _client is None:
+        return False
+    return _client.topology_description.topology_type_name in ("ReplicaSetWithPrimary", "Sharded", "LoadBalanced")
+
+def start_session():
+    """Start a client session (use as `async with start_session() as session`)"""
+    if _client is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+    return _client.start_session()
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict], session=None):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -40,10 +77,26 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict, session=session)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
+async def create_documents(collection_name: str, items: List[Union[BaseModel, dict]], session=None):
+    """Insert many documents with timestamps in a single bulk round-trip"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    now = datetime.now(timezone.utc)
+    docs = []
+    for data in items:
+        data_dict = data.model_dump() if isinstance(data, BaseModel) else data.copy()
+        data_dict['created_at'] = now
+        data_dict['updated_at'] = now
+        docs.append(data_dict)
+
+    result = await db[collection_name].insert_many(docs, ordered=False, session=session)
+    return [str(_id) for _id in result.inserted_ids]
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
     """Get documents from collection"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -52,4 +105,4 @@ def get_documents(collection_name: str, filter_dict: dict = None, limit: int = N
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(None)
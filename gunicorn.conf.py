@@ -0,0 +1,25 @@
+"""
+Production server config
+
+Run with: gunicorn main:app -c gunicorn.conf.py
+"""
+import multiprocessing
+import os
+
+from uvicorn.workers import UvicornWorker
+
+
+class VegHolicWorker(UvicornWorker):
+    # UvicornWorker defaults to loop/http "auto"; pin the fast implementations
+    # and cap in-flight requests per worker.
+    CONFIG_KWARGS = {
+        "loop": "uvloop",
+        "http": "httptools",
+        "limit_concurrency": int(os.getenv("LIMIT_CONCURRENCY", 1000)),
+    }
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = VegHolicWorker
+keepalive = 30
@@ -1,65 +1,163 @@
+import asyncio
+import functools
+import hashlib
+import logging
 import os
+import re
 from typing import List, Optional, Any, Dict
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, OperationFailure
+import orjson
 
-from database import db, create_document, get_documents
-from schemas import User as UserSchema, Product as ProductSchema, Address as AddressSchema, CartItem as CartItemSchema, Order as OrderSchema
+from database import connect_db, close_db, create_document, create_documents, get_documents, start_session, supports_transactions
+from cache import connect_cache, close_cache, cache_get, cache_set, cache_delete
+from schemas import MODEL_CONFIG, User as UserSchema, Product as ProductSchema, Address as AddressSchema, Order as OrderSchema
 
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title="VegHolic API", version="1.1.0")
+
+# ------------ Serialization -------------
+def _bson_default(obj: Any) -> Any:
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dump_json(content: Any) -> bytes:
+    """Serialize raw Mongo documents; orjson handles traversal and datetimes natively."""
+    return orjson.dumps(content, default=_bson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MongoJSONResponse(ORJSONResponse):
+    """Return this directly from routes that hand back Mongo documents, so the
+    content skips FastAPI's jsonable_encoder pass and goes straight to orjson."""
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
+
+
+app = FastAPI(title="VegHolic API", version="1.1.0", default_response_class=MongoJSONResponse)
+
+# Bound in on_startup so AsyncMongoClient is created on the serving event loop
+db = None
+
+# Added before CORS so CORS stays outermost and preflights skip compression
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=5)
+
+# Comma-separated list, e.g. "https://vegholic.app,http://localhost:3000"
+CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "https://vegholic.app").split(",") if o.strip()]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PATCH", "DELETE"],
+    allow_headers=["authorization", "content-type"],
+    max_age=86400,
 )
 
 
 # ------------ Helpers -------------
-class ObjectIdEncoder:
-    @staticmethod
-    def encode(doc: Any) -> Any:
-        if isinstance(doc, list):
-            return [ObjectIdEncoder.encode(d) for d in doc]
-        if isinstance(doc, dict):
-            out: Dict[str, Any] = {}
-            for k, v in doc.items():
-                if isinstance(v, ObjectId):
-                    out[k] = str(v)
-                elif isinstance(v, list) or isinstance(v, dict):
-                    out[k] = ObjectIdEncoder.encode(v)
-                else:
-                    out[k] = v
-            return out
-        if isinstance(doc, ObjectId):
-            return str(doc)
-        return doc
+def json_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
+
+# Bump to invalidate client/CDN copies when the payload shape changes
+PRODUCTS_ETAG_VERSION = "v1"
+PRODUCTS_CACHE_CONTROL = "public, max-age=300, stale-while-revalidate=60"
+
+
+def cacheable_json_response(request: Request, body: bytes) -> Response:
+    """JSON response with ETag/Cache-Control; 304 when the client copy is current."""
+    # Weak: the hash covers the identity body, but GZipMiddleware may serve it
+    # compressed under the same tag, and strong tags must differ per coding.
+    tag = f'"{PRODUCTS_ETAG_VERSION}-{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": "W/" + tag, "Cache-Control": PRODUCTS_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        if tag in candidates or "*" in candidates:
+            # GZipMiddleware never sees a body here, so add the Vary it puts on the 200
+            return Response(status_code=304, headers={**headers, "Vary": "Accept-Encoding"})
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def user_id_query(user_id: str = Query(...)) -> str:
+    # Request bodies are stripped by MODEL_CONFIG; trim query ids the same way
+    # so lookups match what was stored
+    return user_id.strip()
 
 
+_OID_RE = re.compile(r"[0-9a-fA-F]{24}")
+
+
+@functools.lru_cache(maxsize=4096)
 def oid(id_str: str) -> ObjectId:
-    try:
-        return ObjectId(id_str)
-    except Exception:
+    # Reject malformed ids up front instead of via ObjectId's exception path;
+    # errors are not cached, so only valid ids occupy the LRU.
+    if not _OID_RE.fullmatch(id_str):
         raise HTTPException(status_code=400, detail="Invalid id format")
+    return ObjectId(id_str)
+
+
+# ------------ Projections -------------
+def rupees(path: str) -> dict:
+    """Projection expression deriving a rupee amount from its integer `<path>_paise`
+    field; documents written before the paise migration fall back to the float."""
+    return {"$ifNull": [{"$divide": [f"{path}_paise", 100]}, path]}
+
+
+# Per-endpoint field selection so list reads only decode what the client renders.
+# Amounts are stored as integer paise and formatted to rupees here, in the DB.
+PRODUCT_LIST_FIELDS = {
+    "name": 1, "category": 1, "image_url": 1, "variants": 1,
+    "price_per_kg_paise": 1, "price_per_kg": rupees("$price_per_kg"),
+}
+PRODUCT_FIELDS = {**PRODUCT_LIST_FIELDS, "description": 1, "created_at": 1, "updated_at": 1}
+CART_FIELDS = {
+    "user_id": 1, "product_id": 1, "product_name": 1, "image_url": 1, "variant": 1, "qty": 1,
+    "created_at": 1, "updated_at": 1,
+    "price_paise": 1, "price": rupees("$price"),
+}
+ORDER_SUMMARY_FIELDS = {
+    "user_id": 1, "address_id": 1, "payment_method": 1, "status": 1, "eta": 1,
+    "created_at": 1, "updated_at": 1,
+    "total_amount_paise": 1, "total_amount": rupees("$total_amount"),
+}
+ORDER_FIELDS = {
+    **ORDER_SUMMARY_FIELDS,
+    "items": {"$map": {
+        "input": "$items",
+        "in": {"$mergeObjects": ["$$this", {"price": rupees("$$this.price")}]},
+    }},
+}
+ADDRESS_FIELDS = {"created_at": 0, "updated_at": 0}
 
 
 # ------------ Request/Response Models -------------
 class OTPRequest(BaseModel):
+    model_config = MODEL_CONFIG
+
     phone: str
 
 
 class OTPVerify(BaseModel):
+    model_config = MODEL_CONFIG
+
     phone: str
     otp: str
     name: Optional[str] = None
 
 
 class AddToCartRequest(BaseModel):
+    model_config = MODEL_CONFIG
+
     user_id: str
     product_id: str
     variant: str = "1kg"
@@ -67,6 +165,8 @@ class AddToCartRequest(BaseModel):
 
 
 class UpdateCartQty(BaseModel):
+    model_config = MODEL_CONFIG
+
     qty: int
 
 
@@ -75,6 +175,8 @@ class AddressCreate(AddressSchema):
 
 
 class CreateOrderRequest(BaseModel):
+    model_config = MODEL_CONFIG
+
     user_id: str
     address_id: str
     payment_method: str
@@ -85,119 +187,170 @@ SAMPLE_PRODUCTS = [
     {
         "name": "Spinach",
         "description": "Fresh leafy spinach, rich in iron.",
-        "price_per_kg": 80.0,
+        "price_per_kg_paise": 8000,
         "category": "leafy",
         "image_url": "https://images.unsplash.com/photo-1604909052743-94e838986d24?q=80&w=800&auto=format&fit=crop",
     },
     {
         "name": "Carrot",
         "description": "Crunchy sweet carrots.",
-        "price_per_kg": 60.0,
+        "price_per_kg_paise": 6000,
         "category": "root",
         "image_url": "https://images.unsplash.com/photo-1547514701-42782101795e?q=80&w=800&auto=format&fit=crop",
     },
     {
         "name": "Tomato",
         "description": "Juicy farm tomatoes.",
-        "price_per_kg": 50.0,
+        "price_per_kg_paise": 5000,
         "category": "fruits",
         "image_url": "https://images.unsplash.com/photo-1546470427-2abef20b2c52?q=80&w=800&auto=format&fit=crop",
     },
     {
         "name": "Potato",
         "description": "All-purpose potatoes.",
-        "price_per_kg": 35.0,
+        "price_per_kg_paise": 3500,
         "category": "root",
         "image_url": "https://images.unsplash.com/photo-1570233476081-60c2a2a55fe4?q=80&w=800&auto=format&fit=crop",
     },
     {
         "name": "Cucumber",
         "description": "Cool and refreshing cucumbers.",
-        "price_per_kg": 45.0,
+        "price_per_kg_paise": 4500,
         "category": "fruits",
         "image_url": "https://images.unsplash.com/photo-1613743983595-cf000a6b8ec3?q=80&w=800&auto=format&fit=crop",
     },
     {
         "name": "Cabbage",
         "description": "Crisp green cabbage.",
-        "price_per_kg": 40.0,
+        "price_per_kg_paise": 4000,
         "category": "leafy",
         "image_url": "https://images.unsplash.com/photo-1601000938259-d3c9d0948a3a?q=80&w=800&auto=format&fit=crop",
     },
     {
         "name": "Beetroot",
         "description": "Sweet earthy beets.",
-        "price_per_kg": 70.0,
+        "price_per_kg_paise": 7000,
         "category": "root",
         "image_url": "https://images.unsplash.com/photo-1510627498534-cf7e9002facc?q=80&w=800&auto=format&fit=crop",
     },
     {
         "name": "Organic Lettuce",
         "description": "Organic crunchy lettuce.",
-        "price_per_kg": 120.0,
+        "price_per_kg_paise": 12000,
         "category": "organic",
         "image_url": "https://images.unsplash.com/photo-1566786630087-54f3ad504fcd?q=80&w=800&auto=format&fit=crop",
     },
 ]
 
 
-def ensure_seed_products():
+# Validated once at import; create_documents copies each dict, so these stay pristine
+_SEED_DOCS = tuple(ProductSchema(**p).model_dump() for p in SAMPLE_PRODUCTS)
+
+
+async def ensure_seed_products():
     if db is None:
         return
-    count = db["product"].count_documents({})
+    # Collection metadata count; no scan needed just to check for emptiness
+    count = await db["product"].estimated_document_count()
     if count == 0:
-        for p in SAMPLE_PRODUCTS:
-            prod = ProductSchema(**p)
-            create_document("product", prod)
+        try:
+            await create_documents("product", list(_SEED_DOCS))
+        except BulkWriteError as e:
+            # Another worker seeded first; the unique name index rejected our copies
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+        await invalidate_product_cache()
+
+
+# ------------ Indexes -------------
+CART_KEY_INDEX = [("user_id", 1), ("product_id", 1), ("variant", 1)]
+
+INDEXES = [
+    ("cartitem", CART_KEY_INDEX, {"unique": True}),
+    ("address", [("user_id", 1)], {}),
+    ("order", [("user_id", 1), ("created_at", -1)], {}),
+    ("user", [("phone", 1)], {"unique": True}),
+    # Lets concurrently starting workers all seed without duplicating products
+    ("product", [("name", 1)], {"unique": True}),
+]
+
+
+async def ensure_indexes():
+    if db is None:
+        return
+    for collection, keys, options in INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except OperationFailure as e:
+            # e.g. existing duplicates block a unique index; keep serving without it
+            logger.warning("Could not create index %s on %s: %s", keys, collection, e)
 
 
 # ------------ Routes -------------
 @app.on_event("startup")
-def on_startup():
-    ensure_seed_products()
+async def on_startup():
+    global db
+    db = await connect_db()
+    await connect_cache()
+    await ensure_indexes()
+    await ensure_seed_products()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await close_db()
+    await close_cache()
+
+
+# Constant bodies are serialized once at import; these routes just hand back bytes
+_ROOT_RESP = json_response(orjson.dumps({"message": "VegHolic API running"}))
+_HEALTH_RESP = json_response(orjson.dumps({"status": "ok"}))
+# Basic schemas info for viewer
+_SCHEMA_RESP = json_response(orjson.dumps({
+    "collections": ["user", "product", "address", "cartitem", "order"],
+}))
+# Everything after the echoed phone; spliced in as '{"phone":...,' + tail
+_OTP_TAIL = orjson.dumps({"otp": "1234", "message": "Use 1234 to login (demo)"})[1:]
 
 
 @app.get("/", tags=["health"]) 
-def read_root():
-    return {"message": "VegHolic API running"}
+async def read_root():
+    return _ROOT_RESP
 
 
 @app.get("/api/health", tags=["health"]) 
-def health():
-    return {"status": "ok"}
+async def health():
+    return _HEALTH_RESP
 
 
 @app.get("/schema", tags=["schema"]) 
-def get_schema():
-    # Basic schemas info for viewer
-    return {
-        "collections": ["user", "product", "address", "cartitem", "order"],
-    }
+async def get_schema():
+    return _SCHEMA_RESP
 
 
 # ---------- Auth (Mock OTP) ----------
 @app.post("/api/auth/request-otp", tags=["auth"]) 
-def request_otp(payload: OTPRequest):
+async def request_otp(payload: OTPRequest):
     # In production, send OTP via SMS. Here we return a static OTP for demo.
-    return {"phone": payload.phone, "otp": "1234", "message": "Use 1234 to login (demo)"}
+    return json_response(b'{"phone":' + orjson.dumps(payload.phone) + b"," + _OTP_TAIL)
 
 
 @app.post("/api/auth/verify-otp", tags=["auth"]) 
-def verify_otp(payload: OTPVerify):
+async def verify_otp(payload: OTPVerify):
     if payload.otp != "1234":
         raise HTTPException(status_code=400, detail="Invalid OTP")
 
     # Find existing user
-    existing = db["user"].find_one({"phone": payload.phone})
+    existing = await db["user"].find_one({"phone": payload.phone})
     if existing:
         token = existing.get("token") or payload.phone + "-token"
-        db["user"].update_one({"_id": existing["_id"]}, {"$set": {"token": token, "name": existing.get("name") or payload.name}})
+        await db["user"].update_one({"_id": existing["_id"]}, {"$set": {"token": token, "name": existing.get("name") or payload.name}})
         user_id = str(existing["_id"])
     else:
         user = UserSchema(phone=payload.phone, name=payload.name or "VegHolic User")
-        new_id = create_document("user", user)
+        new_id = await create_document("user", user)
         token = payload.phone + "-token"
-        db["user"].update_one({"_id": oid(new_id)}, {"$set": {"token": token}})
+        await db["user"].update_one({"_id": oid(new_id)}, {"$set": {"token": token}})
         user_id = new_id
 
     return {"user_id": user_id, "token": token}
@@ -205,20 +358,20 @@ def verify_otp(payload: OTPVerify):
 
 # Compatibility endpoints for alternative specs
 @app.post("/api/auth/login", tags=["auth"]) 
-def login_placeholder():
+async def login_placeholder():
     # Email/password login not implemented in demo mode
     raise HTTPException(status_code=501, detail="Email/password login not enabled. Use OTP endpoints: /api/auth/request-otp and /api/auth/verify-otp")
 
 
 @app.post("/api/auth/signup", tags=["auth"]) 
-def signup_placeholder():
+async def signup_placeholder():
     # Email/password signup not implemented in demo mode
     raise HTTPException(status_code=501, detail="Email/password signup not enabled. Use OTP endpoints: /api/auth/request-otp and /api/auth/verify-otp")
 
 
 # ---------- Products ----------
 @app.get("/api/products", tags=["products"]) 
-def list_products(category: Optional[str] = Query(default=None), q: Optional[str] = Query(default=None), page: int = Query(1, ge=1), limit: int = Query(50, ge=1, le=100)):
+async def list_products(request: Request, category: Optional[str] = Query(default=None), q: Optional[str] = Query(default=None), page: int = Query(1, ge=1), limit: int = Query(50, ge=1, le=100)):
     filt: Dict[str, Any] = {}
     if category:
         filt["category"] = category
@@ -228,90 +381,107 @@ def list_products(category: Optional[str] = Query(default=None), q: Optional[str
             {"name": {"$regex": q, "$options": "i"}},
             {"description": {"$regex": q, "$options": "i"}},
         ]
-    skip = (page - 1) * limit
-    total = db["product"].count_documents(filt)
-    products = list(db["product"].find(filt).skip(skip).limit(limit))
-    return {"products": ObjectIdEncoder.encode(products), "total": total, "page": page}
+    # JSON-encode the filter values so None, "all" and ":" inside q can't collide
+    cache_key = "products:" + orjson.dumps([category, q, page, limit]).decode()
+    body = await cache_get(cache_key)
+    if body is None:
+        skip = (page - 1) * limit
+        total = await db["product"].count_documents(filt)
+        products = await db["product"].find(filt, PRODUCT_LIST_FIELDS).skip(skip).limit(limit).to_list(None)
+        body = dump_json({"products": products, "total": total, "page": page})
+        await cache_set(cache_key, body)
+    return cacheable_json_response(request, body)
 
 
 @app.get("/api/search", tags=["products"]) 
-def search_products(q: Optional[str] = Query(default=None), category: Optional[str] = Query(default=None), page: int = Query(1, ge=1), limit: int = Query(20, ge=1, le=100)):
-    return list_products(category=category, q=q, page=page, limit=limit)
+async def search_products(request: Request, q: Optional[str] = Query(default=None), category: Optional[str] = Query(default=None), page: int = Query(1, ge=1), limit: int = Query(20, ge=1, le=100)):
+    return await list_products(request, category=category, q=q, page=page, limit=limit)
 
 
 @app.get("/api/products/{product_id}", tags=["products"]) 
-def get_product(product_id: str):
-    prod = db["product"].find_one({"_id": oid(product_id)})
-    if not prod:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return ObjectIdEncoder.encode(prod)
+async def get_product(request: Request, product_id: str):
+    _id = oid(product_id)
+    cache_key = f"product:{product_id}"
+    body = await cache_get(cache_key)
+    if body is None:
+        prod = await db["product"].find_one({"_id": _id}, PRODUCT_FIELDS)
+        if not prod:
+            raise HTTPException(status_code=404, detail="Product not found")
+        body = dump_json(prod)
+        await cache_set(cache_key, body)
+    return cacheable_json_response(request, body)
+
+
+async def invalidate_product_cache(*product_ids: str):
+    """Call after any write to the product collection."""
+    await cache_delete(*(f"product:{pid}" for pid in product_ids), prefix="products:")
 
 
 # ---------- Cart ----------
-WEIGHT_MULTIPLIER = {
-    "250g": 0.25,
-    "500g": 0.5,
-    "1kg": 1.0,
-    "2kg": 2.0,
+# Variant weight in quarter-kilos, so pricing stays in integer paise
+WEIGHT_MULT_NUM = {
+    "250g": 1,
+    "500g": 2,
+    "1kg": 4,
+    "2kg": 8,
 }
 
 
-def calc_price(price_per_kg: float, variant: str) -> float:
-    m = WEIGHT_MULTIPLIER.get(variant, 1.0)
-    return round(price_per_kg * m, 2)
+def calc_price_paise(price_per_kg_paise: int, variant: str) -> int:
+    return price_per_kg_paise * WEIGHT_MULT_NUM.get(variant, 4) // 4
 
 
 @app.get("/api/cart", tags=["cart"]) 
-def get_cart(user_id: str = Query(...)):
-    items = list(db["cartitem"].find({"user_id": user_id}))
-    return ObjectIdEncoder.encode(items)
+async def get_cart(user_id: str = Depends(user_id_query)):
+    items = await db["cartitem"].find({"user_id": user_id}, CART_FIELDS).to_list(None)
+    return MongoJSONResponse(items)
 
 
 @app.post("/api/cart/add", tags=["cart"]) 
-def add_to_cart(payload: AddToCartRequest):
-    prod = db["product"].find_one({"_id": oid(payload.product_id)})
+async def add_to_cart(payload: AddToCartRequest):
+    prod = await db["product"].find_one({"_id": oid(payload.product_id)})
     if not prod:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    unit_price = calc_price(prod.get("price_per_kg", 0.0), payload.variant)
-
-    existing = db["cartitem"].find_one({
-        "user_id": payload.user_id,
-        "product_id": payload.product_id,
-        "variant": payload.variant,
-    })
-    if existing:
-        new_qty = max(1, int(existing.get("qty", 1)) + payload.qty)
-        db["cartitem"].update_one({"_id": existing["_id"]}, {"$set": {"qty": new_qty}})
-        item_id = str(existing["_id"])
-    else:
-        item = CartItemSchema(
-            user_id=payload.user_id,
-            product_id=payload.product_id,
-            product_name=prod.get("name"),
-            image_url=prod.get("image_url"),
-            variant=payload.variant,
-            qty=payload.qty,
-            price=unit_price,
-        )
-        item_id = create_document("cartitem", item)
+    price_per_kg_paise = prod.get("price_per_kg_paise")
+    if price_per_kg_paise is None:
+        price_per_kg_paise = round(prod.get("price_per_kg", 0) * 100)
+    unit_price_paise = calc_price_paise(price_per_kg_paise, payload.variant)
+
+    # One atomic upsert on the unique cart key: bumps qty (never below 1) on an
+    # existing line, or creates the line with the product snapshot.
+    item = await db["cartitem"].find_one_and_update(
+        {"user_id": payload.user_id, "product_id": payload.product_id, "variant": payload.variant},
+        [{"$set": {
+            "qty": {"$max": [1, {"$add": [{"$ifNull": ["$qty", 0]}, payload.qty]}]},
+            "product_name": {"$ifNull": ["$product_name", {"$literal": prod.get("name")}]},
+            "image_url": {"$ifNull": ["$image_url", {"$literal": prod.get("image_url")}]},
+            "price_paise": {"$ifNull": ["$price_paise", unit_price_paise]},
+            "created_at": {"$ifNull": ["$created_at", "$$NOW"]},
+            "updated_at": "$$NOW",
+        }}],
+        projection={"_id": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    item_id = str(item["_id"])
 
     return {"item_id": item_id}
 
 
 @app.post("/api/cart/{item_id}/qty", tags=["cart"]) 
-def update_cart_qty(item_id: str, payload: UpdateCartQty):
+async def update_cart_qty(item_id: str, payload: UpdateCartQty):
     if payload.qty < 1:
         raise HTTPException(status_code=400, detail="Quantity must be >= 1")
-    res = db["cartitem"].update_one({"_id": oid(item_id)}, {"$set": {"qty": int(payload.qty)}})
+    res = await db["cartitem"].update_one({"_id": oid(item_id)}, {"$set": {"qty": int(payload.qty)}})
     if res.matched_count == 0:
         raise HTTPException(status_code=404, detail="Cart item not found")
     return {"ok": True}
 
 
 @app.delete("/api/cart/{item_id}", tags=["cart"]) 
-def remove_cart_item(item_id: str):
-    res = db["cartitem"].delete_one({"_id": oid(item_id)})
+async def remove_cart_item(item_id: str):
+    res = await db["cartitem"].delete_one({"_id": oid(item_id)})
     if res.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Cart item not found")
     return {"ok": True}
@@ -319,36 +489,36 @@ def remove_cart_item(item_id: str):
 
 # ---------- Addresses ----------
 @app.get("/api/addresses", tags=["address"]) 
-def list_addresses(user_id: str = Query(...)):
-    items = list(db["address"].find({"user_id": user_id}))
-    return ObjectIdEncoder.encode(items)
+async def list_addresses(user_id: str = Depends(user_id_query)):
+    items = await db["address"].find({"user_id": user_id}, ADDRESS_FIELDS).to_list(None)
+    return MongoJSONResponse(items)
 
 
 @app.post("/api/addresses", tags=["address"]) 
-def create_address(payload: AddressCreate):
-    addr_id = create_document("address", payload)
+async def create_address(payload: AddressCreate):
+    addr_id = await create_document("address", payload)
     if payload.is_default:
-        db["address"].update_many({"user_id": payload.user_id, "_id": {"$ne": oid(addr_id)}}, {"$set": {"is_default": False}})
-        db["user"].update_one({"_id": oid(payload.user_id)}, {"$set": {"default_address_id": addr_id}})
+        await db["address"].update_many({"user_id": payload.user_id, "_id": {"$ne": oid(addr_id)}}, {"$set": {"is_default": False}})
+        await db["user"].update_one({"_id": oid(payload.user_id)}, {"$set": {"default_address_id": addr_id}})
     return {"address_id": addr_id}
 
 
 @app.patch("/api/addresses/{address_id}", tags=["address"]) 
-def update_address(address_id: str, payload: dict):
+async def update_address(address_id: str, payload: dict):
     if not payload:
         return {"ok": True}
-    db["address"].update_one({"_id": oid(address_id)}, {"$set": payload})
+    await db["address"].update_one({"_id": oid(address_id)}, {"$set": payload})
     if payload.get("is_default"):
-        addr = db["address"].find_one({"_id": oid(address_id)})
+        addr = await db["address"].find_one({"_id": oid(address_id)})
         if addr:
-            db["address"].update_many({"user_id": addr["user_id"], "_id": {"$ne": oid(address_id)}}, {"$set": {"is_default": False}})
-            db["user"].update_one({"_id": oid(addr["user_id"])}, {"$set": {"default_address_id": address_id}})
+            await db["address"].update_many({"user_id": addr["user_id"], "_id": {"$ne": oid(address_id)}}, {"$set": {"is_default": False}})
+            await db["user"].update_one({"_id": oid(addr["user_id"])}, {"$set": {"default_address_id": address_id}})
     return {"ok": True}
 
 
 @app.delete("/api/addresses/{address_id}", tags=["address"]) 
-def delete_address(address_id: str):
-    res = db["address"].delete_one({"_id": oid(address_id)})
+async def delete_address(address_id: str):
+    res = await db["address"].delete_one({"_id": oid(address_id)})
     if res.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Address not found")
     return {"ok": True}
@@ -356,62 +526,99 @@ def delete_address(address_id: str):
 
 # ---------- Orders ----------
 ORDER_STATUSES = ["Order Placed", "Packed", "On The Way", "Delivered"]
+ORDER_STATUS_IDX = {s: i for i, s in enumerate(ORDER_STATUSES)}
+
+
+def cart_total_pipeline(user_id: str) -> List[dict]:
+    """Cart lines plus their grand total in a single aggregation round-trip."""
+    return [
+        {"$match": {"user_id": user_id}},
+        {"$group": {
+            "_id": None,
+            "total": {"$sum": {"$multiply": [
+                {"$ifNull": ["$price_paise", {"$round": [{"$multiply": [{"$ifNull": ["$price", 0]}, 100]}, 0]}]},
+                {"$ifNull": ["$qty", 1]},
+            ]}},
+            "items": {"$push": "$$ROOT"},
+        }},
+    ]
+
+
+async def load_cart(user_id: str, session=None):
+    cursor = await db["cartitem"].aggregate(cart_total_pipeline(user_id), session=session)
+    res = await cursor.to_list(1)
+    if not res:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    return res[0]["items"], res[0]["total"]
 
 
-@app.post("/api/orders/create", tags=["orders"]) 
-def create_order(payload: CreateOrderRequest):
-    user_id = payload.user_id
-    cart = list(db["cartitem"].find({"user_id": user_id}))
-    if not cart:
-        raise HTTPException(status_code=400, detail="Cart is empty")
-    total = 0.0
-    for it in cart:
-        total += float(it.get("price", 0.0)) * int(it.get("qty", 1))
-    order = OrderSchema(
-        user_id=user_id,
+def build_order(payload: CreateOrderRequest, cart: List[dict], total_paise: int) -> OrderSchema:
+    return OrderSchema(
+        user_id=payload.user_id,
         items=cart,
         address_id=payload.address_id,
         payment_method=payload.payment_method,
-        total_amount=round(total, 2),
+        total_amount_paise=int(total_paise),
         status=ORDER_STATUSES[0],
         eta="30-45 mins",
     )
-    order_id = create_document("order", order)
-    # Clear cart
-    db["cartitem"].delete_many({"user_id": user_id})
+
+
+@app.post("/api/orders/create", tags=["orders"]) 
+async def create_order(payload: CreateOrderRequest):
+    user_id = payload.user_id
+    # Only clear the items that went into the order, not ones added meanwhile
+    if supports_transactions():
+        async def checkout(session):
+            cart, total = await load_cart(user_id, session=session)
+            order_id = await create_document("order", build_order(payload, cart, total), session=session)
+            await db["cartitem"].delete_many({"_id": {"$in": [it["_id"] for it in cart]}}, session=session)
+            return order_id
+
+        # with_transaction retries on TransientTransactionError (e.g. a write
+        # conflict with a concurrent add_to_cart) and UnknownTransactionCommitResult
+        async with start_session() as session:
+            order_id = await session.with_transaction(checkout)
+    else:
+        # Standalone server: no transactions, so only clear the cart once the
+        # order insert has succeeded; a failed insert must leave the cart intact
+        cart, total = await load_cart(user_id)
+        order_id = await create_document("order", build_order(payload, cart, total))
+        await db["cartitem"].delete_many({"_id": {"$in": [it["_id"] for it in cart]}})
     return {"order_id": order_id}
 
 
 # Compatibility alias for specs using /api/order/create
 @app.post("/api/order/create", tags=["orders"]) 
-def create_order_alias(payload: CreateOrderRequest):
-    return create_order(payload)
+async def create_order_alias(payload: CreateOrderRequest):
+    return await create_order(payload)
 
 
 @app.get("/api/orders", tags=["orders"]) 
-def list_orders(user_id: str = Query(...)):
-    orders = list(db["order"].find({"user_id": user_id}).sort("created_at", -1))
-    return ObjectIdEncoder.encode(orders)
+async def list_orders(user_id: str = Depends(user_id_query), include_items: bool = Query(False)):
+    projection = ORDER_FIELDS if include_items else ORDER_SUMMARY_FIELDS
+    orders = await db["order"].find({"user_id": user_id}, projection).sort("created_at", -1).to_list(None)
+    return MongoJSONResponse(orders)
 
 
 @app.get("/api/orders/{order_id}", tags=["orders"]) 
-def get_order(order_id: str):
-    o = db["order"].find_one({"_id": oid(order_id)})
+async def get_order(order_id: str):
+    o = await db["order"].find_one({"_id": oid(order_id)}, ORDER_FIELDS)
     if not o:
         raise HTTPException(status_code=404, detail="Order not found")
-    return ObjectIdEncoder.encode(o)
+    return MongoJSONResponse(o)
 
 
 @app.get("/api/orders/{order_id}/track", tags=["orders"]) 
-def track_order(order_id: str):
-    o = db["order"].find_one({"_id": oid(order_id)})
+async def track_order(order_id: str):
+    o = await db["order"].find_one({"_id": oid(order_id)})
     if not o:
         raise HTTPException(status_code=404, detail="Order not found")
     # delivery_boy_location_map is out of scope; return mock coordinates
     tracking = {
         "status": o.get("status", ORDER_STATUSES[0]),
         "steps": ORDER_STATUSES,
-        "active_index": ORDER_STATUSES.index(o.get("status", ORDER_STATUSES[0])),
+        "active_index": ORDER_STATUS_IDX.get(o.get("status", ORDER_STATUSES[0]), 0),
         "eta": o.get("eta", "30-45 mins"),
         "location": {"lat": 12.9716, "lng": 77.5946},
     }
@@ -420,42 +627,42 @@ def track_order(order_id: str):
 
 # Compatibility alias for specs using /api/order/track with query param
 @app.get("/api/order/track", tags=["orders"]) 
-def track_order_alias(order_id: str = Query(...)):
-    return track_order(order_id)
+async def track_order_alias(order_id: str = Query(...)):
+    return await track_order(order_id)
 
 
 @app.post("/api/orders/{order_id}/advance", tags=["orders"]) 
-def advance_order(order_id: str):
-    o = db["order"].find_one({"_id": oid(order_id)})
+async def advance_order(order_id: str):
+    o = await db["order"].find_one({"_id": oid(order_id)})
     if not o:
         raise HTTPException(status_code=404, detail="Order not found")
     status = o.get("status", ORDER_STATUSES[0])
-    try:
-        idx = ORDER_STATUSES.index(status)
-    except ValueError:
-        idx = 0
+    idx = ORDER_STATUS_IDX.get(status, 0)
     new_status = ORDER_STATUSES[min(idx + 1, len(ORDER_STATUSES) - 1)]
-    db["order"].update_one({"_id": o["_id"]}, {"$set": {"status": new_status}})
+    await db["order"].update_one({"_id": o["_id"]}, {"$set": {"status": new_status}})
     return {"status": new_status}
 
 
 # ---------- Profile ----------
 @app.get("/api/profile", tags=["profile"]) 
-def get_profile(user_id: str = Query(...)):
-    u = db["user"].find_one({"_id": oid(user_id)})
+async def get_profile(user_id: str = Depends(user_id_query)):
+    # The three reads are independent, so issue them concurrently
+    u, addresses, orders = await asyncio.gather(
+        db["user"].find_one({"_id": oid(user_id)}),
+        db["address"].find({"user_id": user_id}, ADDRESS_FIELDS).to_list(None),
+        db["order"].find({"user_id": user_id}, ORDER_SUMMARY_FIELDS).sort("created_at", -1).limit(5).to_list(None),
+    )
     if not u:
         raise HTTPException(status_code=404, detail="User not found")
-    addresses = list(db["address"].find({"user_id": user_id}))
-    orders = list(db["order"].find({"user_id": user_id}).limit(5).sort("created_at", -1))
-    return {
-        "user": ObjectIdEncoder.encode(u),
-        "addresses": ObjectIdEncoder.encode(addresses),
-        "recent_orders": ObjectIdEncoder.encode(orders),
-    }
+    return MongoJSONResponse({
+        "user": u,
+        "addresses": addresses,
+        "recent_orders": orders,
+    })
 
 
 @app.get("/test", tags=["health"]) 
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -472,7 +679,7 @@ def test_database():
             response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = await db.list_collection_names()
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
@@ -491,4 +698,13 @@ def test_database():
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        # "auto" picks uvloop when installed (it is skipped on Windows)
+        loop="auto",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        limit_concurrency=int(os.getenv("LIMIT_CONCURRENCY", 1000)),
+    )
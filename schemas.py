@@ -5,10 +5,16 @@ Each Pydantic model represents a MongoDB collection.
 Collection name is the lowercase class name.
 """
 from typing import List, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+
+# Shared by every collection model and the API request models: trim stray
+# whitespace from client input so stored values and lookups agree.
+MODEL_CONFIG = ConfigDict(str_strip_whitespace=True)
 
 
 class User(BaseModel):
+    model_config = MODEL_CONFIG
+
     phone: str = Field(..., description="Phone number used for login")
     name: Optional[str] = Field(None, description="Display name")
     email: Optional[str] = Field(None, description="Optional email")
@@ -17,15 +23,19 @@ class User(BaseModel):
 
 
 class Product(BaseModel):
+    model_config = MODEL_CONFIG
+
     name: str = Field(..., description="Product name")
     description: Optional[str] = Field(None, description="Short description")
-    price_per_kg: float = Field(..., ge=0, description="Base price per kg in INR")
+    price_per_kg_paise: int = Field(..., ge=0, description="Base price per kg in paise (INR/100)")
     category: str = Field(..., description="Category: leafy, root, fruits, organic")
     image_url: Optional[str] = Field(None, description="Image URL")
     variants: List[str] = Field(default_factory=lambda: ["250g", "500g", "1kg", "2kg"], description="Weight options")
 
 
 class Address(BaseModel):
+    model_config = MODEL_CONFIG
+
     user_id: str = Field(..., description="Owner user's _id as string")
     name: str
     mobile: str
@@ -36,20 +46,24 @@ class Address(BaseModel):
 
 
 class CartItem(BaseModel):
+    model_config = MODEL_CONFIG
+
     user_id: str = Field(..., description="Owner user's _id as string")
     product_id: str
     product_name: str
     image_url: Optional[str] = None
     variant: str = Field("1kg", description="Selected weight option")
     qty: int = Field(1, ge=1, description="Quantity of the selected variant")
-    price: float = Field(..., ge=0, description="Unit price for this variant")
+    price_paise: int = Field(..., ge=0, description="Unit price for this variant in paise")
 
 
 class Order(BaseModel):
+    model_config = MODEL_CONFIG
+
     user_id: str
-    items: list
+    items: List[dict]
     address_id: str
     payment_method: str = Field(..., description="COD | UPI | Card")
-    total_amount: float
+    total_amount_paise: int = Field(..., ge=0, description="Order total in paise")
     status: str = Field("Order Placed", description="Current status")
     eta: str = Field("30-45 mins", description="Estimated time of delivery")